@@ -1,28 +1,248 @@
+import os
+
+# Cooperative I/O for gunicorn's gevent workers: must patch before anything imports sockets/threads
+GEVENT = os.environ.get('GEVENT') == '1'
+if GEVENT:
+    from gevent import monkey
+    monkey.patch_all()
+
+import gzip
+import hashlib
+import queue
+import re
 import sqlite3
+import struct
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
+import numba
+import numpy as np
+import orjson
+import pandas as pd
 import yfinance as yf
+from curl_cffi import requests as curl_requests
+
+class OrjsonProvider(JSONProvider):
+    """Encodes responses with orjson, which serializes NumPy arrays natively in C"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # --- SYSTEM ARCHITECTURE: CACHING & DATABASE ---
 # In-memory cache to prevent API rate-limiting and improve load speeds
-API_CACHE = {}
 CACHE_TTL = 300  # 5 minutes
+CACHE_SWR = 1800  # Serve stale data for up to 30 minutes while refreshing
+CACHE_MAX_ENTRIES = 512
+
+class TTLCache:
+    """Bounded LRU cache with stale-while-revalidate expiry on a monotonic clock"""
+
+    def __init__(self, ttl, swr, max_entries):
+        self.ttl = ttl
+        self.swr = swr
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (data, needs_refresh); needs_refresh is only True for the first stale hit"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+
+            age = now - entry['timestamp']
+            if age >= max(self.swr, entry['ttl']):  # A longer per-entry TTL also extends the hard expiry
+                del self._entries[key]
+                return None, False
+
+            self._entries.move_to_end(key)
+            if age < entry['ttl'] or key in self._refreshing:
+                return entry['data'], False
+
+            self._refreshing.add(key)
+            return entry['data'], True
+
+    def put(self, key, data, ttl=None):
+        """Stores fresh data (optionally with its own TTL), evicting least recently used entries past the bound"""
+        with self._lock:
+            self._entries[key] = {'timestamp': time.monotonic(), 'ttl': ttl or self.ttl, 'data': data}
+            self._entries.move_to_end(key)
+            self._refreshing.discard(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def release(self, key):
+        """Lets the next stale hit retry after a failed background refresh"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+QUOTE_TTL = 30  # Price/change only; the history below keeps the longer TTL
+QUOTE_SWR = 60  # A shown price is never more than a minute old; past that it is fetched synchronously
+# Rejects junk symbols before they reach yfinance or take up cache slots
+TICKER_RE = re.compile(r'[A-Z0-9^][A-Z0-9.=\-]{0,11}')
+INVALID_TICKER = {"error": "Invalid ticker symbol"}
+
+MAX_BATCH_TICKERS = 50  # Bounds the outbound fetches one /api/quotes request can trigger
+
+REFRESH_INTERVAL = 240  # Watchlist tickers are re-fetched just under CACHE_TTL
+
+API_CACHE = TTLCache(CACHE_TTL, CACHE_SWR, CACHE_MAX_ENTRIES)  # Quote + history payloads
+QUOTE_CACHE = TTLCache(QUOTE_TTL, QUOTE_SWR, CACHE_MAX_ENTRIES)  # Price/change only
+
+# One keep-alive HTTP session for every yfinance call, so misses reuse warm TLS connections.
+# yfinance only accepts curl_cffi/requests sessions and rejects caching ones (requests_cache),
+# so API_CACHE stays the only response cache. curl_cffi's perform() is a blocking C call,
+# so under gevent it must run in gevent mode or every fetch stalls the worker's hub.
+YF_SESSION = curl_requests.Session(impersonate="chrome", thread="gevent" if GEVENT else None)
+
+# Single-flight: one yfinance fetch per (kind, ticker) at a time, concurrent misses wait on its Event
+class _Flight:
+    """An in-progress fetch; waiters block on done, then read result or error"""
+    __slots__ = ('done', 'result', 'error')  # gevent's Event has no __dict__, so results live here
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+INFLIGHT = {}
+INFLIGHT_LOCK = threading.Lock()
+INFLIGHT_TIMEOUT = 5  # seconds
+
+# Persistent connection pool: keeps SQLite's page cache warm across requests
+# and removes connect/close from the request path
+DB_PATH = 'market.db'
+DB_POOL_SIZE = 1 if GEVENT else 8  # SQLite serializes writers anyway; one per gevent worker
+DB_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+DB_WRITE_LOCK = threading.Lock()  # Serializes writers across Flask's worker threads
+
+# PRAGMAs are connection-scoped, so every pooled connection gets the full set
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+def _connect():
+    """Opens a tuned SQLite connection for the pool"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+for _ in range(DB_POOL_SIZE):
+    DB_POOL.put(_connect())
+
+@contextmanager
+def get_conn():
+    """Borrows a connection from the pool and returns it when done"""
+    conn = DB_POOL.get()
+    try:
+        yield conn
+    finally:
+        try:
+            # Never hand the next borrower a half-finished transaction (e.g. after "database is locked")
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A connection we can't roll back is unusable; swap in a fresh one
+            conn.close()
+            conn = _connect()
+        finally:
+            DB_POOL.put(conn)
+
+# Constant SQL text so each pooled connection's statement cache reuses the compiled statement
+SQL_SELECT_WATCHLIST = "SELECT ticker FROM watchlist ORDER BY added_on DESC"
+SQL_INSERT_TICKER = "INSERT OR IGNORE INTO watchlist (ticker) VALUES (?)"
+SQL_DELETE_TICKER = "DELETE FROM watchlist WHERE ticker = ?"
+
+WATCHLIST_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticker TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        added_on DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
 
 def init_db():
     """Initializes the SQLite database for user state (Watchlist)"""
-    conn = sqlite3.connect('market.db')
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS watchlist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticker TEXT NOT NULL UNIQUE,
-            added_on DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_conn() as conn, DB_WRITE_LOCK:
+        conn.execute(WATCHLIST_SCHEMA.format(table='watchlist'))
+
+        # Older databases compare tickers case-sensitively; rebuild them with NOCASE
+        schema = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'watchlist'").fetchone()[0]
+        if 'COLLATE NOCASE' not in schema:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(WATCHLIST_SCHEMA.format(table='watchlist_nocase'))
+            conn.execute('''
+                INSERT OR IGNORE INTO watchlist_nocase (id, ticker, added_on)
+                SELECT id, ticker, added_on FROM watchlist ORDER BY id
+            ''')
+            conn.execute("DROP TABLE watchlist")
+            conn.execute("ALTER TABLE watchlist_nocase RENAME TO watchlist")
+        conn.commit()
+
+@numba.njit(cache=True, fastmath=True)
+def _am4_kernel(ts, values, width):
+    """Marks the first/min/max/last point of each pixel-wide time bucket (AM4)"""
+    n = len(values)
+    keep = np.zeros(n, dtype=np.bool_)
+    span = ts[n - 1] - ts[0] + 1
+
+    bucket = -1
+    first = low = high = last = 0
+    for i in range(n):
+        b = (ts[i] - ts[0]) * width // span
+        if b != bucket:
+            if bucket >= 0:
+                keep[first] = keep[low] = keep[high] = keep[last] = True
+            bucket = b
+            first = low = high = last = i
+        else:
+            if values[i] < values[low]:
+                low = i
+            if values[i] > values[high]:
+                high = i
+            last = i
+    keep[first] = keep[low] = keep[high] = keep[last] = True
+
+    kept = np.flatnonzero(keep).astype(np.int32)
+    return kept, values[kept]
+
+def decimate_am4(history, width):
+    """Reduces a price history to first/min/max/last per pixel bucket (AM4)"""
+    offsets = history['offsets']
+    n = len(offsets)
+
+    # Every pixel already holds at most four points, nothing to drop
+    if width <= 0 or n <= 4 * width:
+        return history
+
+    kept, prices = _am4_kernel(offsets.astype(np.int64), history['prices'], width)
+    return {
+        "base": history['base'],
+        "offsets": offsets[kept],
+        "prices": prices
+    }
+
+# Compile (or load the on-disk cache) at startup so the first request doesn't pay JIT latency
+_am4_kernel(np.arange(8, dtype=np.int64), np.zeros(8, dtype=np.float32), 2)
 
 # --- FRONTEND TEMPLATE (HTML/JS/CSS) ---
 # Embedded to create a seamless Single-Page Application (SPA)
@@ -73,7 +293,7 @@ HTML_TEMPLATE = """
                 <!-- Chart Card -->
                 <div id="chartCard" class="hidden bg-white p-6 rounded-xl shadow-sm border border-slate-100">
                     <h3 class="text-lg font-semibold mb-4 text-slate-700">30-Day Price History</h3>
-                    <canvas id="stockChart" height="250"></canvas>
+                    <canvas id="stockChart" height="250" class="w-full"></canvas>
                 </div>
             </div>
 
@@ -93,12 +313,51 @@ HTML_TEMPLATE = """
     <script>
         let priceChart = null;
         let currentTicker = '';
+        const quoteCache = {};  // Prefetched watchlist quotes, keyed by ticker
+        const QUOTE_CACHE_MS = 300 * 1000;  // Same lifetime as the server's CACHE_TTL
 
         // Initialize
         document.addEventListener('DOMContentLoaded', () => {
             loadWatchlist();
         });
 
+        // Built once, when the chart card is first shown; later searches only swap the dataset
+        function createChart() {
+            const canvas = document.getElementById('stockChart');
+            canvas.width = canvas.clientWidth;  // Fit the card once, then stay fixed (responsive: false)
+            const ctx = canvas.getContext('2d');
+            return new Chart(ctx, {
+                type: 'line',
+                data: {
+                    datasets: [{
+                        label: 'Closing Price ($)',
+                        data: [],
+                        borderColor: '#2563eb',
+                        backgroundColor: 'rgba(37, 99, 235, 0.1)',
+                        borderWidth: 2,
+                        fill: true,
+                        tension: 0.1,
+                        pointRadius: 0
+                    }]
+                },
+                options: {
+                    responsive: false,  // Fixed canvas size, no devicePixelRatio reflow on resize
+                    parsing: false,
+                    animation: false,
+                    spanGaps: true,
+                    interaction: { intersect: false, mode: 'index' },
+                    plugins: {
+                        decimation: { enabled: true, algorithm: 'min-max' },
+                        legend: { display: false },
+                        tooltip: {
+                            callbacks: { title: items => new Date(items[0].parsed.x).toISOString().slice(0, 10) }
+                        }
+                    },
+                    scales: { x: { type: 'linear', display: false } }
+                }
+            });
+        }
+
         // Handle Form Submit (AJAX Request)
         document.getElementById('searchForm').addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -115,7 +374,7 @@ HTML_TEMPLATE = """
             errorBanner.classList.add('hidden');
 
             try {
-                // Fetch from our RESTful Backend
+                // Fetch from our RESTful Backend: the light quote first, so the price card paints early
                 const response = await fetch(`/api/quote/${ticker}`);
                 const data = await response.json();
 
@@ -123,6 +382,19 @@ HTML_TEMPLATE = """
 
                 currentTicker = ticker;
                 updateUI(data);
+
+                // Then the heavier history for the chart
+                const historyRes = await fetch(`/api/history/${ticker}?w=${chartWidth()}`, {
+                    headers: { 'Accept': 'application/octet-stream' }
+                });
+
+                if (!historyRes.ok) {
+                    const historyData = await historyRes.json();
+                    throw new Error(historyData.error || 'Failed to fetch history');
+                }
+
+                const { baseMs, offsets, prices } = decodeHistory(await historyRes.arrayBuffer());
+                updateChart(baseMs, offsets, prices);
             } catch (error) {
                 errorBanner.innerText = error.message;
                 errorBanner.classList.remove('hidden');
@@ -132,10 +404,26 @@ HTML_TEMPLATE = """
             }
         }
 
+        // Binary history (SoA): [u64 base ms][u32 n][Float32 prices x n][Uint16 day offsets x n]
+        function decodeHistory(buf) {
+            const dv = new DataView(buf);
+            const baseMs = Number(dv.getBigUint64(0, true));
+            const n = dv.getUint32(8, true);
+            const prices = new Float32Array(buf, 12, n);
+            const offsets = new Uint16Array(buf, 12 + n * 4, n);
+            return { baseMs, offsets, prices };
+        }
+
+        // Chart width in device pixels, so the server only sends what can be drawn
+        function chartWidth() {
+            const card = document.getElementById('chartCard');
+            const cssWidth = card.clientWidth || window.innerWidth;
+            return Math.round(cssWidth * (window.devicePixelRatio || 1));
+        }
+
         function updateUI(data) {
             // Update Price Card
             document.getElementById('priceCard').classList.remove('hidden');
-            document.getElementById('chartCard').classList.remove('hidden');
             document.getElementById('addWatchlistBtn').classList.remove('hidden');
             
             document.getElementById('stockSymbol').innerText = data.symbol;
@@ -145,32 +433,18 @@ HTML_TEMPLATE = """
             const isPositive = data.change >= 0;
             changeEl.innerText = `${isPositive ? '+' : ''}${data.change.toFixed(2)}%`;
             changeEl.className = `text-lg font-semibold mt-1 ${isPositive ? 'text-green-600' : 'text-red-600'}`;
+        }
 
-            // Update Chart
-            if (priceChart) priceChart.destroy();
-            const ctx = document.getElementById('stockChart').getContext('2d');
-            priceChart = new Chart(ctx, {
-                type: 'line',
-                data: {
-                    labels: data.history.dates,
-                    datasets: [{
-                        label: 'Closing Price ($)',
-                        data: data.history.prices,
-                        borderColor: '#2563eb',
-                        backgroundColor: 'rgba(37, 99, 235, 0.1)',
-                        borderWidth: 2,
-                        fill: true,
-                        tension: 0.1,
-                        pointRadius: 0
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    interaction: { intersect: false, mode: 'index' },
-                    plugins: { legend: { display: false } },
-                    scales: { x: { display: false } }
-                }
-            });
+        function updateChart(baseMs, offsets, prices) {
+            document.getElementById('chartCard').classList.remove('hidden');
+            if (!priceChart) priceChart = createChart();
+
+            // Numeric {x, y} points so Chart.js can skip parsing and decimate;
+            // date labels are only built by the tooltip callback
+            const points = Array.from(prices, (y, i) => ({ x: baseMs + offsets[i] * 86400000, y }));
+
+            priceChart.data.datasets[0].data = points;
+            priceChart.update('none');
         }
 
         async function loadWatchlist() {
@@ -184,11 +458,35 @@ HTML_TEMPLATE = """
             }
 
             container.innerHTML = items.map(item => `
-                <li class="flex justify-between items-center p-3 bg-slate-50 rounded border border-slate-100 hover:bg-slate-100 cursor-pointer transition-colors" onclick="fetchStockData('${item.ticker}')">
+                <li class="flex justify-between items-center p-3 bg-slate-50 rounded border border-slate-100 hover:bg-slate-100 cursor-pointer transition-colors" onclick="showQuote('${item.ticker}')">
                     <span class="font-semibold">${item.ticker}</span>
                     <button onclick="event.stopPropagation(); removeFromWatchlist('${item.ticker}')" class="text-red-400 hover:text-red-600 text-sm">✖</button>
                 </li>
             `).join('');
+
+            // Prefetch every watchlist quote in one batch so clicking a row is instant
+            const tickers = items.map(item => item.ticker).join(',');
+            const quotesRes = await fetch(`/api/quotes?tickers=${tickers}&w=${chartWidth()}`);
+            if (quotesRes.ok) {
+                const fetchedAt = Date.now();
+                for (const [ticker, quote] of Object.entries(await quotesRes.json())) {
+                    quoteCache[ticker] = { quote, fetchedAt };
+                }
+            }
+        }
+
+        function showQuote(ticker) {
+            const cached = quoteCache[ticker];
+            if (!cached || Date.now() - cached.fetchedAt > QUOTE_CACHE_MS) {
+                delete quoteCache[ticker];
+                return fetchStockData(ticker);
+            }
+
+            currentTicker = ticker;
+            document.getElementById('errorBanner').classList.add('hidden');
+            updateUI(cached.quote);
+            const { base, offsets, prices } = cached.quote.history;
+            updateChart(Date.parse(base), offsets, prices);
         }
 
         async function addToWatchlist() {
@@ -210,91 +508,347 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# The template has no variables, so it is encoded, compressed and hashed once at import
+_HTML_BYTES = HTML_TEMPLATE.encode('utf-8')
+_HTML_GZ = gzip.compress(_HTML_BYTES, 9)
+_ETAG = hashlib.md5(_HTML_BYTES).hexdigest()
+_ETAG_GZ = _ETAG + '-gz'  # Strong validators must differ per content-coding
+
 # --- BACKEND RESTful API ROUTES ---
 
+def _for_width(data, width):
+    """Returns the cached quote with its history decimated to the client's chart width"""
+    if not width:
+        return data
+    return {**data, "history": decimate_am4(data['history'], width)}
+
+def _price_fields(ticker, closes):
+    """Builds the price/change quote payload from an array of closes"""
+    current_price = float(closes[-1])
+    prev_price = float(closes[-2])
+    change_percent = (current_price / prev_price - 1.0) * 100.0
+    return {"symbol": ticker, "price": current_price, "change": change_percent}
+
+def _fetch_price(ticker):
+    """Fetches just the latest closes from yfinance and caches price/change"""
+    stock = yf.Ticker(ticker, session=YF_SESSION)
+    hist = stock.history(period="5d")
+
+    if len(hist) < 2:
+        return None
+
+    data = _price_fields(ticker, hist['Close'].to_numpy())
+    QUOTE_CACHE.put(ticker, data)
+    return data
+
+def _fetch_history(ticker):
+    """Downloads a month of history from yfinance and caches the packaged quote"""
+    stock = yf.Ticker(ticker, session=YF_SESSION)
+    hist = stock.history(period="1mo")
+    return _package_quote(ticker, hist)
+
+def _fetch_batch(tickers):
+    """Downloads history for several tickers in one parallel yf.download call"""
+    frame = yf.download(tickers=tickers, period="1mo", group_by='ticker', threads=True,
+                        progress=False, session=YF_SESSION)
+    quotes = {}
+    for ticker in tickers:
+        if isinstance(frame.columns, pd.MultiIndex):
+            if ticker not in frame.columns.get_level_values(0):
+                continue
+            hist = frame[ticker]
+        else:
+            hist = frame
+        data = _package_quote(ticker, hist.dropna(subset=['Close']))
+        if data is not None:
+            quotes[ticker] = data
+    return quotes
+
+def _package_quote(ticker, hist):
+    """Builds the quote payload from a history DataFrame and caches it"""
+    if len(hist) < 2:
+        return None
+
+    # Work on the raw ndarrays once instead of going through pandas accessors per field
+    closes = hist['Close'].to_numpy()
+
+    # Dates go out as a base date plus whole-day offsets (exchange-local, so DST can't skew them)
+    index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+    days = index.values.astype('datetime64[D]')
+
+    # Package data for frontend
+    data = {
+        **_price_fields(ticker, closes),
+        "history": {
+            "base": str(days[0]),
+            "offsets": (days - days[0]).astype(np.int16),  # NumPy arrays go straight to orjson
+            "prices": closes.astype(np.float32)
+        }
+    }
+
+    # Save to Cache
+    API_CACHE.put(ticker, data)
+    return data
+
+def _fetch_coalesced(kind, tickers, fetch):
+    """Runs fetch(claimed) for tickers nobody is fetching yet and waits for the rest"""
+    claimed = []
+    waiting = {}
+    with INFLIGHT_LOCK:
+        for ticker in tickers:
+            if (kind, ticker) in INFLIGHT:
+                waiting[ticker] = INFLIGHT[(kind, ticker)]
+            else:
+                INFLIGHT[(kind, ticker)] = _Flight()
+                claimed.append(ticker)
+
+    results = {}
+    error = None
+    try:
+        if claimed:
+            results = fetch(claimed)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Hand the outcome to every waiter before releasing the ticker; each ticker is
+        # released on its own so one failure can't leave the others stuck in INFLIGHT
+        with INFLIGHT_LOCK:
+            for ticker in claimed:
+                flight = INFLIGHT.pop((kind, ticker), None)
+                if flight is None:
+                    continue
+                try:
+                    flight.result = results.get(ticker)
+                    flight.error = error
+                finally:
+                    flight.done.set()
+
+    deadline = time.monotonic() + INFLIGHT_TIMEOUT
+    late = []
+    for ticker, flight in waiting.items():
+        if not flight.done.wait(timeout=max(0, deadline - time.monotonic())):
+            late.append(ticker)
+            continue
+        if flight.error is not None:
+            raise flight.error
+        results[ticker] = flight.result
+
+    # The fetch we waited on is still running (e.g. a slow batch); fetch these ourselves
+    if late:
+        results.update(fetch(late))
+
+    return {ticker: data for ticker, data in results.items() if data is not None}
+
+def _fetch_one(kind, fetch_one, ticker):
+    """Coalesced fetch of a single ticker"""
+    return _fetch_coalesced(kind, [ticker], lambda _: {ticker: fetch_one(ticker)}).get(ticker)
+
+def _refresh(cache, kind, fetch_one, ticker):
+    """Background stale-while-revalidate refresh of a cached entry"""
+    try:
+        if _fetch_one(kind, fetch_one, ticker) is not None:
+            return
+    except Exception:
+        pass
+    cache.release(ticker)
+
+def _refresh_batch(tickers):
+    """Background stale-while-revalidate refresh of several histories in one download"""
+    try:
+        refreshed = _fetch_coalesced('history', tickers, _fetch_batch)
+    except Exception:
+        refreshed = {}
+    for ticker in tickers:
+        if ticker not in refreshed:
+            API_CACHE.release(ticker)
+
+def _get_cached(cache, kind, fetch_one, ticker):
+    """Serves from cache (refreshing stale entries in the background), fetching on a miss"""
+    data, needs_refresh = cache.get(ticker)
+    if needs_refresh:
+        threading.Thread(target=_refresh, args=(cache, kind, fetch_one, ticker), daemon=True).start()
+    if data is None:
+        data = _fetch_one(kind, fetch_one, ticker)
+    return data
+
+def _refresh_loop():
+    """Keeps watchlist tickers warm in both caches so their requests are pure hits"""
+    while True:
+        try:
+            with get_conn() as conn:
+                tickers = [row[0] for row in conn.execute(SQL_SELECT_WATCHLIST)]
+            if tickers:
+                # Same single-flight gate as on-demand fetches, so the two never race
+                quotes = _fetch_coalesced('history', tickers, _fetch_batch)
+                for ticker, data in quotes.items():
+                    # Outlive the refresh cadence so watchlist quotes never go stale between cycles
+                    # Packaged quotes are _price_fields plus history; strip history to get the quote payload
+                    quote = {k: v for k, v in data.items() if k != 'history'}
+                    QUOTE_CACHE.put(ticker, quote, ttl=CACHE_TTL)
+        except Exception:
+            app.logger.exception("Watchlist cache refresh failed")
+        time.sleep(REFRESH_INTERVAL)
+
+def start_refresher():
+    """Starts the background watchlist refresher"""
+    threading.Thread(target=_refresh_loop, daemon=True).start()
+
+def _pack_history(history):
+    """Encodes a history as one SoA buffer: [u64 base ms][u32 n][f32 prices x n][u16 day offsets x n]"""
+    base_ms = int(np.datetime64(history['base'], 'ms').astype(np.int64))
+    prices = np.asarray(history['prices'], dtype='<f4')
+    offsets = np.asarray(history['offsets'], dtype='<u2')
+    # Prices sit right after the 12-byte header so the Float32Array view stays 4-byte aligned
+    return struct.pack('<QI', base_ms, len(prices)) + prices.tobytes() + offsets.tobytes()
+
+def _history_response(data, width):
+    """Sends the history as binary when the client asks for it, JSON otherwise"""
+    data = _for_width(data, width)
+    if request.accept_mimetypes.best_match(['application/json', 'application/octet-stream']) == 'application/octet-stream':
+        return Response(_pack_history(data['history']), mimetype='application/octet-stream')
+    return jsonify(data)
+
 @app.route('/')
 def home():
     """Serves the Single Page Application"""
-    return render_template_string(HTML_TEMPLATE)
+    use_gzip = request.accept_encodings['gzip'] > 0  # 'gzip;q=0' means the client refuses it
+    etag = _ETAG_GZ if use_gzip else _ETAG
+
+    # A client still holding the other variant can revalidate it too
+    cached_etag = next((tag for tag in (etag, _ETAG, _ETAG_GZ) if request.if_none_match.contains(tag)), None)
+    if cached_etag:
+        response = Response(status=304)
+        etag = cached_etag
+    elif use_gzip:
+        response = Response(_HTML_GZ, mimetype='text/html', headers={'Content-Encoding': 'gzip'})
+    else:
+        response = Response(_HTML_BYTES, mimetype='text/html')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/api/quote/<ticker>', methods=['GET'])
 def get_quote(ticker):
-    """API Endpoint: Fetches stock data with Caching to optimize performance"""
+    """API Endpoint: Fetches the latest price and daily change, cached briefly"""
     ticker = ticker.upper()
-    current_time = time.time()
-
-    # 1. Check Cache
-    if ticker in API_CACHE:
-        cache_entry = API_CACHE[ticker]
-        if current_time - cache_entry['timestamp'] < CACHE_TTL:
-            return jsonify(cache_entry['data'])
-
-    # 2. Fetch fresh data if not in cache or expired
+    if not TICKER_RE.fullmatch(ticker):
+        return jsonify(INVALID_TICKER), 400
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="1mo")
-        
-        if len(hist) < 2:
+        data = _get_cached(QUOTE_CACHE, 'quote', _fetch_price, ticker)
+        if data is None:
             return jsonify({"error": "Ticker not found or insufficient data"}), 404
 
-        current_price = float(hist['Close'].iloc[-1])
-        prev_price = float(hist['Close'].iloc[-2])
-        change_percent = ((current_price - prev_price) / prev_price) * 100
-
-        # Package data for frontend
-        data = {
-            "symbol": ticker,
-            "price": current_price,
-            "change": change_percent,
-            "history": {
-                "dates": hist.index.strftime('%Y-%m-%d').tolist(),
-                "prices": hist['Close'].tolist()
-            }
-        }
+        return jsonify(data)
 
-        # 3. Save to Cache
-        API_CACHE[ticker] = {
-            'timestamp': current_time,
-            'data': data
-        }
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify(data)
+@app.route('/api/history/<ticker>', methods=['GET'])
+def get_history(ticker):
+    """API Endpoint: Fetches the 30-day price history for the chart with Caching"""
+    ticker = ticker.upper()
+    if not TICKER_RE.fullmatch(ticker):
+        return jsonify(INVALID_TICKER), 400
+    width = request.args.get('w', 0, type=int)  # Chart width in device pixels
+
+    try:
+        data = _get_cached(API_CACHE, 'history', _fetch_history, ticker)
+        if data is None:
+            return jsonify({"error": "Ticker not found or insufficient data"}), 404
+
+        return _history_response(data, width)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/quotes', methods=['GET'])
+def get_quotes():
+    """API Endpoint: Fetches several quotes at once, downloading only the cache misses"""
+    # Skip symbols that can't exist on Yahoo instead of failing the whole batch over one
+    symbols = (t.strip().upper() for t in request.args.get('tickers', '').split(','))
+    tickers = list(dict.fromkeys(t for t in symbols if TICKER_RE.fullmatch(t)))
+    if len(tickers) > MAX_BATCH_TICKERS:
+        return jsonify({"error": f"At most {MAX_BATCH_TICKERS} tickers per request"}), 400
+    width = request.args.get('w', 0, type=int)
+
+    quotes = {}
+    misses = []
+    stale = []
+    for ticker in tickers:
+        data, needs_refresh = API_CACHE.get(ticker)
+        if needs_refresh:
+            stale.append(ticker)
+        if data is not None:
+            quotes[ticker] = data
+        else:
+            misses.append(ticker)
+
+    # Stale hits are refreshed together in one background batch, not one fetch per ticker
+    if stale:
+        threading.Thread(target=_refresh_batch, args=(stale,), daemon=True).start()
+
+    if misses:
+        try:
+            quotes.update(_fetch_coalesced('history', misses, _fetch_batch))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    return jsonify({ticker: _for_width(data, width) for ticker, data in quotes.items()})
+
 @app.route('/api/watchlist', methods=['GET', 'POST'])
 def manage_watchlist():
     """API Endpoint: Handles Database CRUD operations for the Watchlist"""
-    conn = sqlite3.connect('market.db')
-    cursor = conn.cursor()
-
     if request.method == 'GET':
-        cursor.execute("SELECT ticker FROM watchlist ORDER BY added_on DESC")
-        items = [{"ticker": row[0]} for row in cursor.fetchall()]
-        conn.close()
+        with get_conn() as conn:
+            rows = conn.execute(SQL_SELECT_WATCHLIST).fetchall()
+        items = [{"ticker": row[0]} for row in rows]
         return jsonify(items)
 
     if request.method == 'POST':
-        ticker = request.json.get('ticker').upper()
-        try:
-            cursor.execute("INSERT INTO watchlist (ticker) VALUES (?)", (ticker,))
+        ticker = (request.json.get('ticker') or '').upper()
+        if not TICKER_RE.fullmatch(ticker):
+            return jsonify(INVALID_TICKER), 400
+        with get_conn() as conn, DB_WRITE_LOCK:
+            conn.execute(SQL_INSERT_TICKER, (ticker,))  # Duplicates are ignored by SQLite
             conn.commit()
-        except sqlite3.IntegrityError:
-            pass # Ignore duplicates
-        finally:
-            conn.close()
         return jsonify({"status": "success", "ticker": ticker})
 
+@app.route('/api/watchlist/bulk', methods=['POST'])
+def bulk_add_to_watchlist():
+    """API Endpoint: Adds several tickers to the Watchlist in a single transaction"""
+    body = request.get_json(silent=True)
+    tickers = body.get('tickers', []) if isinstance(body, dict) else None
+    if not isinstance(tickers, list) or not all(isinstance(t, str) for t in tickers):
+        return jsonify({"error": "tickers must be a list of strings"}), 400
+
+    tickers = [t.upper() for t in tickers]
+    if not all(TICKER_RE.fullmatch(t) for t in tickers):
+        return jsonify(INVALID_TICKER), 400
+    with get_conn() as conn, DB_WRITE_LOCK:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(SQL_INSERT_TICKER, ((t,) for t in tickers))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return jsonify({"status": "success", "tickers": tickers})
+
 @app.route('/api/watchlist/<ticker>', methods=['DELETE'])
 def delete_from_watchlist(ticker):
     """API Endpoint: Removes item from database"""
-    conn = sqlite3.connect('market.db')
-    conn.execute("DELETE FROM watchlist WHERE ticker = ?", (ticker.upper(),))
-    conn.commit()
-    conn.close()
+    # No TICKER_RE check: the value is a bound parameter, and rows saved before validation must stay removable
+    with get_conn() as conn, DB_WRITE_LOCK:
+        conn.execute(SQL_DELETE_TICKER, (ticker,))  # NOCASE column, no need to uppercase
+        conn.commit()
     return jsonify({"status": "deleted"})
 
 if __name__ == '__main__':
     init_db()  # Initialize database on startup
+    # The debug reloader runs this block in its watcher process too; only the serving child refreshes
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_refresher()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,15 @@
+# Production server: gunicorn with gevent workers. GEVENT=1 puts app.YF_SESSION
+# (curl_cffi) in gevent mode, so slow yfinance calls yield on network I/O
+# instead of blocking the whole worker
+#   gunicorn app:app
+bind = "127.0.0.1:8000"
+workers = 2
+worker_class = "gevent"
+worker_connections = 200
+raw_env = ["GEVENT=1"]
+
+def post_worker_init(worker):
+    """Each worker owns its SQLite pool and refresher, so start them after the fork"""
+    from app import init_db, start_refresher
+    init_db()
+    start_refresher()
@@ -0,0 +1,60 @@
+import importlib
+
+import numpy as np
+import pytest
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    # The app opens its SQLite pool in the working directory, so keep it away from the real market.db
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp('db'))
+        mp.setenv('GEVENT', '0')
+        yield importlib.import_module('app')
+
+def brute_am4(ts, values, width):
+    """Reference AM4: first/min/max/last of every bucket, first index winning ties"""
+    span = ts[-1] - ts[0] + 1
+    buckets = (ts - ts[0]) * width // span
+    keep = set()
+    for b in np.unique(buckets):
+        idx = np.flatnonzero(buckets == b)
+        keep.update((idx[0], idx[np.argmin(values[idx])], idx[np.argmax(values[idx])], idx[-1]))
+    return np.array(sorted(keep), dtype=np.int32)
+
+def _history(ts, values):
+    return {"base": "2026-01-01", "offsets": ts.astype(np.int16), "prices": values.astype(np.float32)}
+
+@pytest.mark.parametrize('n, width', [(97, 7), (250, 13), (1000, 3), (41, 10)])
+def test_kernel_matches_brute_force(app, n, width):
+    rng = np.random.default_rng(n * width)
+    # Irregular gaps make buckets hold uneven, odd numbers of points
+    ts = np.cumsum(rng.integers(1, 5, n)).astype(np.int64)
+    values = rng.normal(100, 5, n).astype(np.float32)
+
+    kept, prices = app._am4_kernel(ts, values, width)
+    expected = brute_am4(ts, values, width)
+    np.testing.assert_array_equal(kept, expected)
+    np.testing.assert_array_equal(prices, values[expected])
+
+def test_ties_keep_first_occurrence(app):
+    ts = np.arange(60, dtype=np.int64)
+    # Few distinct levels so every bucket has repeated minima and maxima
+    values = np.tile(np.array([3, 1, 3, 1, 2], dtype=np.float32), 12)
+
+    kept, _ = app._am4_kernel(ts, values, 4)
+    np.testing.assert_array_equal(kept, brute_am4(ts, values, 4))
+
+def test_decimate_maps_offsets_and_prices(app):
+    ts = np.arange(0, 300, 2, dtype=np.int64)
+    values = np.sin(ts / 7.0).astype(np.float32)
+
+    out = app.decimate_am4(_history(ts, values), 9)
+    expected = brute_am4(ts, values, 9)
+    assert out['base'] == "2026-01-01"
+    np.testing.assert_array_equal(out['offsets'], ts[expected].astype(np.int16))
+    np.testing.assert_array_equal(out['prices'], values[expected])
+
+@pytest.mark.parametrize('n, width', [(40, 10), (12, 3), (5, 0), (5, -1)])
+def test_short_histories_are_returned_unchanged(app, n, width):
+    history = _history(np.arange(n), np.arange(n))
+    assert app.decimate_am4(history, width) is history
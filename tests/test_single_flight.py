@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so GEVENT=1 can monkey-patch before app is imported,
+# and in a temp directory so the app's SQLite pool doesn't touch the real market.db
+SCRIPT = textwrap.dedent("""
+    import threading
+    import time
+
+    import app
+
+    calls = []
+
+    def slow_fetch(tickers):
+        calls.append(list(tickers))
+        time.sleep(DELAY)
+        return {ticker: {"symbol": ticker} for ticker in tickers}
+
+    app.INFLIGHT_TIMEOUT = TIMEOUT
+    results = []
+    workers = [
+        threading.Thread(target=lambda: results.append(app._fetch_coalesced('history', ['AAPL', 'MSFT'], slow_fetch)))
+        for _ in range(5)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(results) == 5, results
+    assert all(set(r) == {'AAPL', 'MSFT'} for r in results), results
+    assert not app.INFLIGHT, app.INFLIGHT
+    print(len(calls))
+""")
+
+def _run(gevent, delay, timeout, tmp_path):
+    env = dict(os.environ, PYTHONPATH=REPO, GEVENT='1' if gevent else '0')
+    script = f"DELAY = {delay}\nTIMEOUT = {timeout}\n" + SCRIPT
+    proc = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return int(proc.stdout.strip().splitlines()[-1])
+
+@pytest.mark.parametrize('gevent', [False, True])
+def test_concurrent_misses_share_one_fetch(gevent, tmp_path):
+    if gevent:
+        pytest.importorskip('gevent')
+    assert _run(gevent, delay=0.3, timeout=5, tmp_path=tmp_path) == 1
+
+@pytest.mark.parametrize('gevent', [False, True])
+def test_waiters_fetch_themselves_after_timeout(gevent, tmp_path):
+    if gevent:
+        pytest.importorskip('gevent')
+    # Every waiter gives up on the slow leader and fetches directly instead of failing
+    assert _run(gevent, delay=0.5, timeout=0.1, tmp_path=tmp_path) == 5